@@ -0,0 +1,58 @@
+import os
+import shutil
+import threading
+import time
+
+# --- Configuration ---
+POOL_DIR = "announcement_pool"
+POOL_SIZE = 7 # max number of pre-rendered announcements kept on disk
+POOL_ROTATE_INTERVAL = 86400 # seconds; once the newest announcement is this old, a new one replaces the oldest, so the pool keeps rolling
+
+pool_lock = threading.Lock() # the alarm, the live announcement fallback and the pool worker can all use the pool at once
+
+def pool_files():
+    """Returns the paths of the pre-rendered announcements in the pool, oldest first."""
+    os.makedirs(POOL_DIR, exist_ok=True)
+    # files are named after the time they were added, so sorting by name sorts by age
+    names = sorted(name for name in os.listdir(POOL_DIR) if name.endswith(".pool.mp3"))
+    return [os.path.join(POOL_DIR, name) for name in names]
+
+def pool_needs_refill():
+    """Returns whether the pool is short of announcements, or it's time to roll a new one in."""
+    files = pool_files()
+    if len(files) < POOL_SIZE:
+        return True
+    try:
+        return time.time() - os.path.getmtime(files[-1]) >= POOL_ROTATE_INTERVAL
+    except FileNotFoundError:
+        return True
+
+def add_to_pool(file):
+    """Moves a rendered announcement into the pool, dropping the oldest ones if the pool is over POOL_SIZE."""
+    with pool_lock:
+        os.makedirs(POOL_DIR, exist_ok=True)
+        os.replace(file, os.path.join(POOL_DIR, f"{time.time_ns()}.pool.mp3"))
+        files = pool_files()
+        for old_file in files[:max(len(files) - POOL_SIZE, 0)]:
+            os.remove(old_file)
+    print(f"Announcement pool has {min(len(files), POOL_SIZE)}/{POOL_SIZE} announcements.", flush=True)
+
+def take_from_pool(output_file):
+    """
+    Moves the oldest pre-rendered announcement to output_file, so it can be played without any network access.
+    Returns False if the pool is empty.
+    """
+    # the pool and output_file may be on different filesystems (e.g. /tmp), so copy it next to output_file first,
+    # then rename it so output_file never exists half-written
+    moving_file = f"{os.path.splitext(output_file)[0]}.moving.mp3"
+    with pool_lock:
+        for file in pool_files():
+            try:
+                shutil.move(file, moving_file)
+            except FileNotFoundError:
+                continue # already taken, try the next one
+            os.replace(moving_file, output_file)
+            print(f"Using pre-rendered announcement for '{output_file}'.", flush=True)
+            return True
+    print("Announcement pool is empty.", flush=True)
+    return False
@@ -2,21 +2,28 @@ import datetime
 import os
 import uuid
 import requests
+from utils import http
 
 class EightSleep:
     """
     A client to interact with the Eight Sleep API.
     Handles authentication and provides methods to control the pod.
     """
-    def __init__(self):
+    def __init__(self, account=None):
         """
         Initializes the client by authenticating and fetching the user ID.
+
+        Args:
+            account (str): Suffix of the environment variables holding the credentials, e.g. "PARTNER" reads
+                EIGHTSLEEP_USERNAME_PARTNER and EIGHTSLEEP_PASSWORD_PARTNER, so each side of the pod can use its own user.
+                Defaults to EIGHTSLEEP_USERNAME and EIGHTSLEEP_PASSWORD.
         """
-        self.username = os.getenv("EIGHTSLEEP_USERNAME")
-        self.password = os.getenv("EIGHTSLEEP_PASSWORD")
+        suffix = f"_{account}" if account else ""
+        self.username = os.getenv(f"EIGHTSLEEP_USERNAME{suffix}")
+        self.password = os.getenv(f"EIGHTSLEEP_PASSWORD{suffix}")
         
         if not self.username or not self.password:
-            raise ValueError("EIGHTSLEEP_USERNAME and EIGHTSLEEP_PASSWORD environment variables must be set.")
+            raise ValueError(f"EIGHTSLEEP_USERNAME{suffix} and EIGHTSLEEP_PASSWORD{suffix} environment variables must be set.")
 
         self.access_token = None
         try:
@@ -64,7 +71,7 @@ class EightSleep:
             "password": self.password,
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        response = http.post(url, headers=headers, json=data)
         response.raise_for_status()
         
         self.access_token = response.json().get("access_token")
@@ -83,7 +90,7 @@ class EightSleep:
         url = "https://client-api.8slp.net/v1/users/me"
         headers = self._get_headers()
         
-        response = requests.get(url, headers=headers)
+        response = http.get(url, headers=headers)
         response.raise_for_status()
         
         user_id = response.json().get("user", {}).get("userId")
@@ -106,7 +113,7 @@ class EightSleep:
         url = f"https://app-api.8slp.net/v1/users/{self.user_id}/temperature/pod?ignoreDeviceErrors=false"
         headers = self._get_headers()
         
-        response = requests.put(url, headers=headers, json={
+        response = http.put(url, headers=headers, json={
             "currentState": {
                 "type": "smart" if on else "off"
             }
@@ -129,7 +136,7 @@ class EightSleep:
         url = f"https://app-api.8slp.net/v1/users/{self.user_id}/temperature/pod?ignoreDeviceErrors=false"
         headers = self._get_headers()
 
-        response = requests.put(url, headers=headers, json={
+        response = http.put(url, headers=headers, json={
             "currentLevel": level
         })
         response.raise_for_status()
@@ -1,5 +1,6 @@
 import requests
 import os
+from utils import http
 
 # --- Configuration ---
 # IMPORTANT: Replace with your actual ElevenLabs API key.
@@ -27,7 +28,7 @@ def tts(voice_id: str, text: str, output_filename: str = "output.mp3") -> bool:
     }
 
     try:
-        response = requests.post(f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}", json=data, headers=HEADERS)
+        response = http.post(f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}", json=data, headers=HEADERS)
 
         if response.status_code == 200:
             # The API returns MP3 audio, so it's better to save it as .mp3
@@ -3,4 +3,8 @@
 cd /home/jordan/source/repos/sleep-machine
 source .venv/bin/activate
 export ELEVENLABS_API_KEY=$(cat ELEVENLABS_API_KEY) EIGHTSLEEP_USERNAME=$(cat EIGHTSLEEP_USERNAME) EIGHTSLEEP_PASSWORD=$(cat EIGHTSLEEP_PASSWORD) GEMINI_API_KEY=$(cat GEMINI_API_KEY)
+# credentials for zones on other Eight Sleep accounts, e.g. EIGHTSLEEP_USERNAME_PARTNER and EIGHTSLEEP_PASSWORD_PARTNER
+for file in EIGHTSLEEP_USERNAME_* EIGHTSLEEP_PASSWORD_*; do
+    [ -f "$file" ] && export "$file=$(cat "$file")"
+done
 python main.py &> cron.log
\ No newline at end of file
@@ -5,268 +5,363 @@ import time
 import threading
 import os
 from eightsleep import EightSleep
-from morning import generate_morning_announcement
+from morning import generate_morning_announcement, run_announcement_pool_worker
+from announcement_pool import take_from_pool
+from whitenoise import WhiteNoise
+from speaker import Speaker
 from utils import get_wifi_config
 
-cvlc_process = None
-def play_file(file, repeat=False):
-    global cvlc_process
-    stop_playback()
-    print(f"Playing {file}", flush=True)
-    cvlc_process = subprocess.Popen(
-        ["cvlc", "--repeat", f"file://{file}"] if repeat else ["cvlc", f"file://{file}"])
-    
-def play_file_sync(file):
-    print(f"Playing {file}", flush=True)
-    subprocess.run(["cvlc", "--play-and-exit", f"file://{file}"])
-
-def stop_playback():
-    global cvlc_process
-    if cvlc_process:
-        cvlc_process.kill()
-        cvlc_process = None
-
-# --- GPIO Setup ---
-CLK_PIN = 4
-SW_PIN = 2
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(CLK_PIN, GPIO.IN)
-GPIO.setup(SW_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-# --- State Variables ---
-clk_last_state = GPIO.input(CLK_PIN)
-button_last_state = GPIO.input(SW_PIN)
-white_noise_playing = False
-alarm_mode = False
-backwards_mode = False
-click_timer = None
-click_count = 0
-morning_announcement_generated = False
-alarm_announced = False
-alarm_time = datetime.now()
-last_interaction = datetime.now()
 wifi_config = get_wifi_config()
 
 # --- Configuration ---
-ALARM_PRESETS = [
-    [8, 30], # Mon night (goes off Tue morning)
-    [8, 30], # Tue night (goes off Wed morning)
-    [8, 30], # Wed night (goes off Thu morning)
-    [8, 30], # Thu night (goes off Fri morning)
-    [10, 0], # Fri night (goes off Sat morning)
-    [10, 0], # Sat night (goes off Sun morning)
-    [8, 30], # Sun night (goes off Mon morning)
+ZONES = [
+    {
+        "name": "bedroom",
+        "clk_pin": 4,
+        "sw_pin": 2,
+        "speaker_mac": "F8:0F:F9:BF:9C:E0",
+        "sink": None, # PulseAudio/PipeWire sink to play to (e.g. "bluez_sink.F8_0F_F9_BF_9C_E0.a2dp_sink"), None for the default output
+        "alarm_presets": [
+            [8, 30], # Mon night (goes off Tue morning)
+            [8, 30], # Tue night (goes off Wed morning)
+            [8, 30], # Wed night (goes off Thu morning)
+            [8, 30], # Thu night (goes off Fri morning)
+            [10, 0], # Fri night (goes off Sat morning)
+            [10, 0], # Sat night (goes off Sun morning)
+            [8, 30], # Sun night (goes off Mon morning)
+        ],
+        "pod_temp": -45, # None if this zone has no side of the pod
+        "eightsleep_account": None, # suffix of the EIGHTSLEEP_USERNAME/EIGHTSLEEP_PASSWORD env vars for this side of the pod, None for no suffix
+    },
+    # Add a dict like the one above for each extra encoder/speaker, e.g. the other side of the bed:
+    # {
+    #     "name": "bedroom-left",
+    #     "clk_pin": 17,
+    #     "sw_pin": 27,
+    #     "speaker_mac": "AA:BB:CC:DD:EE:FF",
+    #     "sink": "bluez_sink.AA_BB_CC_DD_EE_FF.a2dp_sink",
+    #     "alarm_presets": [[7, 0], [7, 0], [7, 0], [7, 0], [9, 0], [9, 0], [7, 0]],
+    #     "pod_temp": -20,
+    #     "eightsleep_account": "PARTNER",
+    # },
 ]
 SOUND_PATH = "/home/jordan/source/repos/sleep-machine/"
 WHITE_NOISE_FILE = "Aircraft Lavatory extended.mp3"
+WHITE_NOISE_FADE_IN = 10 # seconds
+WHITE_NOISE_FADE_OUT = 3 # seconds
 ALARM_FILE = "alarm.mp3"
-POD_TEMP = -45
-SPEAKER_MAC = "F8:0F:F9:BF:9C:E0"
-LAST_ALARM_FILE = "last_alarm.txt"
-MORNING_FILE = "/tmp/morning.mp3"
+SPEAKER_WARM_UP = 60 # seconds before the alarm to start waking up the speaker
+SPEAKER_READY_TIMEOUT = 10 # max seconds to wait for the speaker before playing anyway
+LAST_ALARM_FILE = "last_alarm_{zone}.txt"
+MORNING_FILE = "/tmp/morning_{zone}.mp3"
 CONTROL_EIGHT_SLEEP = wifi_config['control_eightsleep'] == 'True' if wifi_config is not None else True
 
-eight_sleep = EightSleep() if CONTROL_EIGHT_SLEEP else None
-
-def set_timezone():
+class Zone:
     """
-    Sets the system timezone based on the currently connected wifi network SSID,
-    which is controlled using wifi_networks.csv.
+    One set of controls: a rotary encoder, a speaker, an alarm schedule and optionally a side of the pod.
+    Every zone runs in this one process, sharing the sound clips, the white noise loop cache, HTTP connections
+    and the morning weather/stocks, so only the announcement itself is generated per zone.
     """
-    city = get_wifi_config()
-    if city is not None:
-        subprocess.run(["sudo", "timedatectl", "set-timezone", city['timezone']])
+    def __init__(self, config, eight_sleep):
+        self.name = config['name']
+        self.clk_pin = config['clk_pin']
+        self.sw_pin = config['sw_pin']
+        self.alarm_presets = config['alarm_presets']
+        self.pod_temp = config['pod_temp']
+        self.eight_sleep = eight_sleep
+        self.last_alarm_file = LAST_ALARM_FILE.format(zone=self.name)
+        self.morning_file = MORNING_FILE.format(zone=self.name)
+        # every player process for this zone gets the zone's sink, so zones don't play over each other
+        self.env = {**os.environ, "PULSE_SINK": config['sink']} if config['sink'] else None
+        self.speaker = Speaker(config['speaker_mac'], warm_up_seconds=SPEAKER_WARM_UP, env=self.env)
+        self.white_noise = WhiteNoise(f"{SOUND_PATH}{WHITE_NOISE_FILE}", env=self.env)
 
-def get_last_alarm_time():
-    if not os.path.exists(LAST_ALARM_FILE):
-        return None
-    with open(LAST_ALARM_FILE, "r") as f:
-        content = f.read().strip()
-        if content:
-            try:
-                return datetime.fromisoformat(content)
-            except ValueError:
-                return None
-    return None
-
-def write_last_alarm_time():
-    with open(LAST_ALARM_FILE, "w") as f:
-        f.write(datetime.now().isoformat())
-
-def alarm_lock_is_active():
-    last_alarm = get_last_alarm_time()
-    if not last_alarm:
-        return False
-    
-    now = datetime.now()
-    # If alarm was on a previous day, lock is off
-    if now.date() > last_alarm.date():
-        return False
-    
-    # If alarm was today, lock is active until 9pm
-    if now.hour >= 21:
-        return False # Lock is lifted at 9pm
-    
-    return True # Lock is active
-
-def handle_clicks():
-    global click_count, white_noise_playing, alarm_time, backwards_mode, eight_sleep, last_interaction, set_default_alarm_and_announce_alarm, play_file, SOUND_PATH, WHITE_NOISE_FILE, POD_TEMP, CONTROL_EIGHT_SLEEP
-
-    now = datetime.now()
-    if click_count == 1:
-        # Single click action
-        if (now - last_interaction) >= timedelta(minutes=5):
-            (# Announce ready state instead of toggling backwards mode
-            set_default_alarm_and_announce_alarm())
-        else:
-            # Toggle backwards mode
-            backwards_mode = not backwards_mode
-            mode_str = "backwards" if backwards_mode else "forwards"
-            print(f"Alarm adjustment set to {mode_str}", flush=True)
-            announcement_file = f"{SOUND_PATH}tts/{mode_str}.mp3"
-            threading.Thread(target=play_file, args=(announcement_file,)).start()
-
-    elif click_count == 2:
-        # Double click action
-        if alarm_lock_is_active(): # Check the lock
-            print("Cannot play white noise, alarm has already gone off today.", flush=True)
-            threading.Thread(target=play_file, args=(f"{SOUND_PATH}tts/notallowed.mp3",)).start()
-        else:
-            if (now - last_interaction) >= timedelta(minutes=5):
-                # Announce ready state instead of changing time
-                set_default_alarm_and_announce_alarm()
-            print(f"Playing white noise, set alarm time is: {alarm_time}", flush=True)
-            play_file(f"{SOUND_PATH}{WHITE_NOISE_FILE}", repeat=True)
-            white_noise_playing = True
-            backwards_mode = False
-            #alarm_time = alarm_time.replace(day=now.day, hour=now.hour, minute=now.minute + 1) # For debugging
-            if alarm_time < now: # if current time is before midnight, the alarm time will be in the past -- move alarm time to tomorrow
-                alarm_time = alarm_time + timedelta(days=1)
-            if CONTROL_EIGHT_SLEEP and not eight_sleep.is_pod_on:
+        # --- GPIO Setup ---
+        GPIO.setup(self.clk_pin, GPIO.IN)
+        GPIO.setup(self.sw_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+        # --- State Variables ---
+        self.cvlc_process = None
+        self.clk_last_state = GPIO.input(self.clk_pin)
+        self.button_last_state = GPIO.input(self.sw_pin)
+        self.white_noise_playing = False
+        self.alarm_mode = False
+        self.backwards_mode = False
+        self.click_timer = None
+        self.click_count = 0
+        self.morning_announcement_generated = False
+        self.alarm_time = datetime.now()
+        self.last_interaction = datetime.now()
+
+    def log(self, message):
+        print(f"[{self.name}] {message}", flush=True)
+
+    def play_file(self, file, repeat=False):
+        self.stop_playback()
+        self.log(f"Playing {file}")
+        self.cvlc_process = subprocess.Popen(
+            ["cvlc", "--repeat", f"file://{file}"] if repeat else ["cvlc", f"file://{file}"], env=self.env)
+
+    def play_file_sync(self, file):
+        self.log(f"Playing {file}")
+        subprocess.run(["cvlc", "--play-and-exit", f"file://{file}"], env=self.env)
+
+    def stop_playback(self):
+        if self.cvlc_process:
+            self.cvlc_process.kill()
+            self.cvlc_process = None
+
+    def set_pod_state(self, on):
+        if self.eight_sleep is None:
+            return
+        try:
+            self.eight_sleep.set_pod_state(on)
+            if on:
+                self.eight_sleep.set_temperature(self.pod_temp)
+        except:
+            self.log("Failed to turn on pod" if on else "Failed to turn off pod")
+
+    @property
+    def is_idle(self):
+        return not self.white_noise_playing and not self.alarm_mode
+
+    def get_last_alarm_time(self):
+        if not os.path.exists(self.last_alarm_file):
+            return None
+        with open(self.last_alarm_file, "r") as f:
+            content = f.read().strip()
+            if content:
                 try:
-                    eight_sleep.set_pod_state(True)
-                    eight_sleep.set_temperature(POD_TEMP)
-                except:
-                    print("Failed to turn on pod", flush=True)
-
-    click_count = 0
-    last_interaction = now
-
-
-def set_default_alarm_and_announce_alarm(readyfile = "alarmset"):
-    global alarm_time, ALARM_PRESETS
-    now = datetime.now()
-    dow = (now - timedelta(hours=3)).weekday() # When calculating the day of week, subtract 3 from the current hour so that on Sun from 12:00am-3:00am it chooses the Sat time to wake up (10:00am)
-    alarm_time = now.replace(hour=ALARM_PRESETS[dow][0], minute=ALARM_PRESETS[dow][1], second=0, microsecond=0)
-    if alarm_time < now: # if current time is before midnight, the alarm time will be in the past -- move alarm time to tomorrow
-        alarm_time = alarm_time + timedelta(days=1)
-    play_file_sync(f"{SOUND_PATH}tts/{readyfile}.mp3")
-    print(f"Set alarm time: {alarm_time}", flush=True)
-    play_file_sync(f"{SOUND_PATH}tts/{alarm_time.hour}{alarm_time.minute}.mp3")
+                    return datetime.fromisoformat(content)
+                except ValueError:
+                    return None
+        return None
 
-set_timezone()
-subprocess.run(["bluetoothctl", "connect", SPEAKER_MAC])
-#time.sleep(2) # wait a few secs b/c bluetooth is glitchy for first few secs after connecting
-#subprocess.run(["amixer", "-c", "2", "sset", "'Speaker'", "100%"])
-print("ready", flush=True)
-set_default_alarm_and_announce_alarm("ready")
-# announce the current time on start up, so if the system time is wrong the user knows
-play_file_sync(f"{SOUND_PATH}tts/currenttime.mp3")
-play_file_sync(f"{SOUND_PATH}tts/int/{datetime.now().hour}.mp3")
-play_file_sync(f"{SOUND_PATH}tts/int/{datetime.now().minute}.mp3")
+    def write_last_alarm_time(self):
+        with open(self.last_alarm_file, "w") as f:
+            f.write(datetime.now().isoformat())
+
+    def alarm_lock_is_active(self):
+        last_alarm = self.get_last_alarm_time()
+        if not last_alarm:
+            return False
 
-try:
-    while True:
-        clk_state = GPIO.input(CLK_PIN)
-        button_state = GPIO.input(SW_PIN)
         now = datetime.now()
+        # If alarm was on a previous day, lock is off
+        if now.date() > last_alarm.date():
+            return False
 
-        if CONTROL_EIGHT_SLEEP and not eight_sleep.is_pod_on and now.hour >= 11:
-            try:
-                eight_sleep.set_pod_state(True)
-                eight_sleep.set_temperature(POD_TEMP)
-            except:
-                print("Failed to turn on pod", flush=True)
+        # If alarm was today, lock is active until 9pm
+        if now.hour >= 21:
+            return False # Lock is lifted at 9pm
+
+        return True # Lock is active
+
+    def handle_clicks(self):
+        now = datetime.now()
+        if self.click_count == 1:
+            # Single click action
+            if (now - self.last_interaction) >= timedelta(minutes=5):
+                (# Announce ready state instead of toggling backwards mode
+                self.set_default_alarm_and_announce_alarm())
+            else:
+                # Toggle backwards mode
+                self.backwards_mode = not self.backwards_mode
+                mode_str = "backwards" if self.backwards_mode else "forwards"
+                self.log(f"Alarm adjustment set to {mode_str}")
+                announcement_file = f"{SOUND_PATH}tts/{mode_str}.mp3"
+                threading.Thread(target=self.play_file, args=(announcement_file,)).start()
+
+        elif self.click_count == 2:
+            # Double click action
+            if self.alarm_lock_is_active(): # Check the lock
+                self.log("Cannot play white noise, alarm has already gone off today.")
+                threading.Thread(target=self.play_file, args=(f"{SOUND_PATH}tts/notallowed.mp3",)).start()
+            else:
+                if (now - self.last_interaction) >= timedelta(minutes=5):
+                    # Announce ready state instead of changing time
+                    self.set_default_alarm_and_announce_alarm()
+                self.log(f"Playing white noise, set alarm time is: {self.alarm_time}")
+                self.stop_playback()
+                if not self.white_noise.start(fade_in_seconds=WHITE_NOISE_FADE_IN):
+                    self.play_file(f"{SOUND_PATH}{WHITE_NOISE_FILE}", repeat=True)
+                self.white_noise_playing = True
+                self.backwards_mode = False
+                #self.alarm_time = self.alarm_time.replace(day=now.day, hour=now.hour, minute=now.minute + 1) # For debugging
+                if self.alarm_time < now: # if current time is before midnight, the alarm time will be in the past -- move alarm time to tomorrow
+                    self.alarm_time = self.alarm_time + timedelta(days=1)
+                self.speaker.schedule_warm_up(self.alarm_time)
+                if self.eight_sleep is not None and not self.eight_sleep.is_pod_on:
+                    self.set_pod_state(True)
+
+        self.click_count = 0
+        self.last_interaction = now
+
+    def set_default_alarm_and_announce_alarm(self, readyfile = "alarmset"):
+        now = datetime.now()
+        dow = (now - timedelta(hours=3)).weekday() # When calculating the day of week, subtract 3 from the current hour so that on Sun from 12:00am-3:00am it chooses the Sat time to wake up (10:00am)
+        self.alarm_time = now.replace(hour=self.alarm_presets[dow][0], minute=self.alarm_presets[dow][1], second=0, microsecond=0)
+        if self.alarm_time < now: # if current time is before midnight, the alarm time will be in the past -- move alarm time to tomorrow
+            self.alarm_time = self.alarm_time + timedelta(days=1)
+        self.play_file_sync(f"{SOUND_PATH}tts/{readyfile}.mp3")
+        self.log(f"Set alarm time: {self.alarm_time}")
+        self.play_file_sync(f"{SOUND_PATH}tts/{self.alarm_time.hour}{self.alarm_time.minute}.mp3")
+
+    def sound_alarm(self):
+        self.speaker.wait_until_ready(SPEAKER_READY_TIMEOUT)
+        if self.alarm_mode: # the alarm could have been dismissed while waiting for the speaker
+            self.white_noise.stop(fade_out_seconds=WHITE_NOISE_FADE_OUT)
+            self.play_file(f"{SOUND_PATH}{ALARM_FILE}")
+
+    def start_up(self):
+        self.speaker.start()
+        self.speaker.wait_until_ready(SPEAKER_READY_TIMEOUT)
+        #subprocess.run(["amixer", "-c", "2", "sset", "'Speaker'", "100%"])
+        self.log("ready")
+        self.set_default_alarm_and_announce_alarm("ready")
+        # announce the current time on start up, so if the system time is wrong the user knows
+        self.play_file_sync(f"{SOUND_PATH}tts/currenttime.mp3")
+        self.play_file_sync(f"{SOUND_PATH}tts/int/{datetime.now().hour}.mp3")
+        self.play_file_sync(f"{SOUND_PATH}tts/int/{datetime.now().minute}.mp3")
+
+    def poll(self, now):
+        """Checks the encoder, button and alarm. Called from the main loop every 10ms."""
+        clk_state = GPIO.input(self.clk_pin)
+        button_state = GPIO.input(self.sw_pin)
+
+        if self.eight_sleep is not None and not self.eight_sleep.is_pod_on and now.hour >= 11:
+            self.set_pod_state(True)
 
         # --- Morning Announcement Logic ---
         # Generate the morning announcement 1 minute before the alarm goes off, so it can play instantly after the alarm is dismissed.
-        if (not morning_announcement_generated and not alarm_mode and white_noise_playing and now >= (alarm_time - timedelta(minutes=1))):
-            morning_announcement_generated = True
-            if os.path.exists(MORNING_FILE):
-                os.remove(MORNING_FILE)
-            threading.Thread(target=generate_morning_announcement, args=(MORNING_FILE,)).start() # generate announcement asynchronously, so if something gets stuck the alarm doesn't fail to be triggered
+        if (not self.morning_announcement_generated and not self.alarm_mode and self.white_noise_playing and now >= (self.alarm_time - timedelta(minutes=1))):
+            self.morning_announcement_generated = True
+            if os.path.exists(self.morning_file):
+                os.remove(self.morning_file)
+            threading.Thread(target=generate_morning_announcement, args=(self.morning_file,)).start() # generate announcement asynchronously, so if something gets stuck the alarm doesn't fail to be triggered
 
         # --- Alarm Trigger Logic ---
-        if (not alarm_mode and white_noise_playing and now >= alarm_time):
-            print("Alarm triggered", flush=True)
-            play_file(f"{SOUND_PATH}{ALARM_FILE}")
-            alarm_mode = True
-            write_last_alarm_time() # Set the lock
+        if (not self.alarm_mode and self.white_noise_playing and now >= self.alarm_time):
+            self.log("Alarm triggered")
+            self.alarm_mode = True
+            threading.Thread(target=self.sound_alarm).start() # waiting for the speaker shouldn't hold up the other zones
+            self.write_last_alarm_time() # Set the lock
 
         # --- Potentiometer Logic ---
-        if not white_noise_playing and clk_state != clk_last_state and clk_state == 1:
-            if (now - last_interaction) >= timedelta(minutes=5):
-                # Announce ready state instead of changing time
-                set_default_alarm_and_announce_alarm()
+        if not self.white_noise_playing and clk_state != self.clk_last_state and clk_state == 1:
+            if (now - self.last_interaction) >= timedelta(minutes=5):
+                # Announce ready state instead of changing time. Announcing blocks, so it runs on its own thread to keep polling the other zones
+                threading.Thread(target=self.set_default_alarm_and_announce_alarm).start()
             else:
-                if alarm_time.hour >= 4 and alarm_time.hour <= 12:
-                    if backwards_mode:
-                        alarm_time -= timedelta(minutes=15)
+                if self.alarm_time.hour >= 4 and self.alarm_time.hour <= 12:
+                    if self.backwards_mode:
+                        self.alarm_time -= timedelta(minutes=15)
                     else:
-                        alarm_time += timedelta(minutes=15)
+                        self.alarm_time += timedelta(minutes=15)
 
-                alarm_time_str = alarm_time.strftime("%H:%M")
-                announcement = f"Alarm set to {alarm_time_str}"
-                print(announcement, flush=True)
-                announcement_file = f"{SOUND_PATH}tts/{alarm_time.hour}{alarm_time.minute}.mp3"
-                threading.Thread(target=play_file, args=(announcement_file,)).start()
-            last_interaction = now
+                alarm_time_str = self.alarm_time.strftime("%H:%M")
+                self.log(f"Alarm set to {alarm_time_str}")
+                announcement_file = f"{SOUND_PATH}tts/{self.alarm_time.hour}{self.alarm_time.minute}.mp3"
+                threading.Thread(target=self.play_file, args=(announcement_file,)).start()
+            self.last_interaction = now
 
         # --- Button Logic ---
-        if button_state != button_last_state and button_state == GPIO.LOW:
-            if click_timer:
-                click_timer.cancel()
-            if alarm_mode:
-                click_count = 0
-                alarm_mode = False
-                white_noise_playing = False
-                morning_announcement_generated = False
-                print("Stopping alarm", flush=True)
-                stop_playback()
-                if os.path.exists(MORNING_FILE):
-                    threading.Thread(target=play_file, args=(MORNING_FILE,)).start()
+        if button_state != self.button_last_state and button_state == GPIO.LOW:
+            if self.click_timer:
+                self.click_timer.cancel()
+            if self.alarm_mode:
+                self.click_count = 0
+                self.alarm_mode = False
+                self.white_noise_playing = False
+                self.morning_announcement_generated = False
+                self.log("Stopping alarm")
+                self.stop_playback()
+                self.white_noise.stop()
+                self.speaker.stop_warm_up()
+                if not os.path.exists(self.morning_file):
+                    # the live announcement missed its deadline, play a pre-rendered one instead
+                    take_from_pool(self.morning_file)
+                if os.path.exists(self.morning_file):
+                    threading.Thread(target=self.play_file, args=(self.morning_file,)).start()
                 else:
-                    threading.Thread(target=play_file, args=(f"{SOUND_PATH}tts/gmorn.mp3",)).start()
-                if CONTROL_EIGHT_SLEEP:
-                    try:
-                        eight_sleep.set_pod_state(False)
-                    except:
-                        print("Failed to turn off pod", flush=True)
-
-            elif white_noise_playing:
-                click_count = 0
-                print("Stopping white noise", flush=True)
-                stop_playback()
-                white_noise_playing = False
-                if CONTROL_EIGHT_SLEEP:
-                    try:
-                        eight_sleep.set_pod_state(False)
-                    except:
-                        print("Failed to turn off pod", flush=True)
+                    threading.Thread(target=self.play_file, args=(f"{SOUND_PATH}tts/gmorn.mp3",)).start()
+                self.set_pod_state(False)
+
+            elif self.white_noise_playing:
+                self.click_count = 0
+                self.log("Stopping white noise")
+                self.stop_playback()
+                self.white_noise.stop(fade_out_seconds=WHITE_NOISE_FADE_OUT)
+                self.speaker.stop_warm_up()
+                self.white_noise_playing = False
+                self.set_pod_state(False)
             else:
-                click_count += 1
-                click_timer = threading.Timer(0.3, handle_clicks)
-                click_timer.start()
+                self.click_count += 1
+                self.click_timer = threading.Timer(0.3, self.handle_clicks)
+                self.click_timer.start()
+
+        self.clk_last_state = clk_state
+        self.button_last_state = button_state
 
-        clk_last_state = clk_state
-        button_last_state = button_state
+    def shut_down(self):
+        if self.click_timer is not None:
+            self.click_timer.cancel()
+        self.stop_playback()
+        self.white_noise.stop()
+        self.speaker.stop_warm_up()
+        #subprocess.run(["bluetoothctl", "disconnect", self.speaker.mac])
+
+def set_timezone():
+    """
+    Sets the system timezone based on the currently connected wifi network SSID,
+    which is controlled using wifi_networks.csv.
+    """
+    city = get_wifi_config()
+    if city is not None:
+        subprocess.run(["sudo", "timedatectl", "set-timezone", city['timezone']])
+
+GPIO.setmode(GPIO.BCM)
+# zones on the same Eight Sleep account share one client
+eight_sleep_clients = {}
+zones = []
+for config in ZONES:
+    eight_sleep = None
+    if CONTROL_EIGHT_SLEEP and config['pod_temp'] is not None:
+        account = config['eightsleep_account']
+        if account not in eight_sleep_clients:
+            try:
+                eight_sleep_clients[account] = EightSleep(account)
+            except ValueError as e:
+                # one zone's missing login shouldn't take down the others
+                print(f"[{config['name']}] {e} Running without pod control.", flush=True)
+                eight_sleep_clients[account] = None
+        eight_sleep = eight_sleep_clients[account]
+    zones.append(Zone(config, eight_sleep))
+
+set_timezone()
+# transcode the white noise loop in the background on start up (only does anything the first time), so it's ready for bedtime.
+# every zone loops the same file, so they all share this one cached loop
+threading.Thread(target=zones[0].white_noise.prepare, daemon=True).start()
+# pre-render fallback morning announcements while idle, so there is always one to play even if the network is down at alarm time
+threading.Thread(target=run_announcement_pool_worker, args=(lambda: all(zone.is_idle for zone in zones),), daemon=True).start()
+# start up every zone at once, so one slow speaker doesn't hold up the others
+start_up_threads = [threading.Thread(target=zone.start_up) for zone in zones]
+for thread in start_up_threads:
+    thread.start()
+for thread in start_up_threads:
+    thread.join()
+print("ready", flush=True)
+
+try:
+    while True:
+        now = datetime.now()
+        for zone in zones:
+            zone.poll(now)
         time.sleep(0.01)
 
 except KeyboardInterrupt:
     print("Exiting", flush=True)
 finally:
-    if click_timer is not None:
-        click_timer.cancel()
-    stop_playback()
-    #subprocess.run(["bluetoothctl", "disconnect", SPEAKER_MAC])
+    for zone in zones:
+        zone.shut_down()
     GPIO.cleanup()
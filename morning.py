@@ -1,5 +1,4 @@
 from datetime import datetime
-import random
 from google import genai
 from google.genai import types
 import requests
@@ -7,8 +6,24 @@ from bs4 import BeautifulSoup
 from elevenlabs import tts
 import csv
 import os
+import threading
 import time
-from utils import get_wifi_config
+from announcement_pool import POOL_DIR, add_to_pool, pool_needs_refill, take_from_pool
+from rotation import ShuffleBag, LineIndex
+from utils import get_wifi_config, http
+
+funfact_index = LineIndex("funfacts.txt", ".funfacts.idx")
+funfact_rotation = ShuffleBag(".funfacts_rotation")
+personality_rotation = ShuffleBag(".personalities_rotation")
+
+# --- Configuration ---
+POOL_REFILL_HOURS = range(11, 20) # hours of the day the announcement pool is refilled in, when nobody is asleep
+POOL_CHECK_INTERVAL = 600 # seconds between checks of whether the announcement pool needs refilling
+MORNING_CONTENT_TTL = 900 # seconds the weather and stocks are reused for, so zones waking up around the same time share one fetch
+
+morning_content = None
+morning_content_fetched_at = 0
+morning_content_lock = threading.Lock()
 
 def get_weather():
     """
@@ -27,7 +42,7 @@ def get_weather():
     try:
         state = city['state'].lower()
         city_name = city['city'].lower().replace(" ", "-")
-        response = requests.get(f"https://www.wunderground.com/weather/us/{state}/{city_name}")
+        response = http.get(f"https://www.wunderground.com/weather/us/{state}/{city_name}")
         response.raise_for_status()  # Raise an exception for bad status codes
         soup = BeautifulSoup(response.text, 'html.parser')
         
@@ -62,7 +77,7 @@ def get_stock_prices():
         try:
             ticker = stock['ticker']
             print(f"Getting stock price for ticker '{ticker}'...")
-            response = requests.get(f"https://api.nasdaq.com/api/quote/{ticker}/info?assetclass=stocks", headers={'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/146.0.0.0 Safari/537.36'})
+            response = http.get(f"https://api.nasdaq.com/api/quote/{ticker}/info?assetclass=stocks", headers={'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/146.0.0.0 Safari/537.36'})
             response.raise_for_status()
             response_json = response.json()
 
@@ -92,55 +107,39 @@ def get_stock_summaries():
         summaries.append(f"The stock '{stock['name']}' is {stock['change']}, and they have {change_word} ${stock['holding_delta']:,.2f} in the stock so far.")
     return summaries
     
+def get_morning_content():
+    """
+    Returns the place name, forecast summary and stock summaries for the morning announcements.
+    They are fetched at most once every MORNING_CONTENT_TTL seconds and shared by every zone.
+    """
+    global morning_content, morning_content_fetched_at
+    with morning_content_lock:
+        if morning_content is None or time.monotonic() - morning_content_fetched_at > MORNING_CONTENT_TTL:
+            place_name, forecast_summary = get_weather()
+            morning_content = (place_name, forecast_summary, get_stock_summaries())
+            morning_content_fetched_at = time.monotonic()
+        return morning_content
+
 def pick_random_funfact():
-    """Read funfacts.txt and return a random line."""
-    with open("funfacts.txt", 'r') as f:
-        lines = [line.strip() for line in f.readlines() if line.strip()]
-    
-    return random.choice(lines)
+    """Return a random line from funfacts.txt, not repeating any until all of them have been used."""
+    with funfact_index.lock:
+        fun_fact = funfact_index.line(funfact_rotation.pick(funfact_index.refresh()))
+        if fun_fact is None:
+            # funfacts.txt shrank since the index was last refreshed
+            fun_fact = funfact_index.line(funfact_rotation.pick(funfact_index.refresh()))
+        return fun_fact
 
 def pick_random_personality():
-    """Read personalities.csv and return a random personality."""
+    """Read personalities.csv and return a random personality, not repeating any until all of them have been used."""
     with open("personalities.csv", 'r') as f:
         reader = csv.DictReader(f)
         personalities = list(reader)
-    previous_personalities = []
-    if os.path.exists(".previous_personalities"):
-        with open(".previous_personalities", 'r') as f:
-            previous_personalities = [line.strip() for line in f.readlines() if line.strip()]
-        if len(previous_personalities) == len(personalities):
-            os.remove(".previous_personalities")
-            previous_personalities = [previous_personalities[-1]]
-    personality = random.choice(personalities)
-    while personality['name'] in previous_personalities:
-        personality = random.choice(personalities)
-    return personality
-
-def get_morning_announcement(personality=None):
+    return personalities[personality_rotation.pick(len(personalities))]
+
+def ask_gemini(prompt, retries=3):
     """
-    Generates a morning announcement with weather and a fun fact.
+    Sends the prompt to Gemini, retrying if it fails. Returns the response text, or None if every attempt failed.
     """
-    if personality is None:
-        personality = pick_random_personality()
-
-    with open(".previous_personalities", 'a') as f:
-        f.write(personality['name'] + "\n")
-
-    # I tried including asking for a fun fact in the gemini prompt, but it kept giving me the same fun fact "A group of owls is called a parliament" lol
-    fun_fact = pick_random_funfact()
-    place_name, forecast_summary = get_weather()
-    stock_summaries = " ".join(get_stock_summaries())
-    stock_summaries_str = f"Then report on their stock movements, which are: {stock_summaries}" if stock_summaries != "" else ""
-
-    today = datetime.now().strftime("%B %d, %Y")
-    name = personality['name']
-    voice_id = personality['voice_id']
-    base_prompt = personality['prompt']
-
-    prompt = f"Your name is {name}. {base_prompt} Today's forecast for {place_name} is {forecast_summary}. Today's date is {today}. First give the weather report for today. {stock_summaries_str} Finally throw in this fun fact: \"{fun_fact}\". Keep it under 200 words." if forecast_summary != None else \
-        f"Your name is {name}. {base_prompt} Unfortunately you were unable to determine today's forecast before getting on. Create an excuse as to why you are unprepared. {stock_summaries_str} Finally, make sure to throw in this fun fact: \"{fun_fact}\". Keep it under 200 words."
-
-    print(f"Generating morning announcement with personality: {name}", flush=True)
     attempt = 0
     client = genai.Client() # GEMINI_API_KEY environment variable automatically set by Client
     while True:
@@ -152,25 +151,108 @@ def get_morning_announcement(personality=None):
             client.close()
             print("Announcement text generated:", flush=True)
             print(response.text, flush=True)
-            return response.text, voice_id
+            return response.text
         except Exception as e:
             print(f"An error occurred calling Gemini: {e}", flush=True)
-            if attempt < 3:
-                print(f"Trying to generate morning announcement again (attempt {attempt + 1}/3)...")
+            if attempt < retries:
+                print(f"Trying to generate announcement again (attempt {attempt + 1}/{retries})...")
                 attempt = attempt + 1
                 time.sleep(5)
             else: 
                 client.close()
-                return fun_fact, voice_id
+                return None
+
+def get_morning_announcement(personality=None, fun_fact=None):
+    """
+    Generates a morning announcement with weather and a fun fact.
+    Returns None as the announcement if Gemini couldn't be reached.
+    """
+    if personality is None:
+        personality = pick_random_personality()
+
+    # I tried including asking for a fun fact in the gemini prompt, but it kept giving me the same fun fact "A group of owls is called a parliament" lol
+    if fun_fact is None:
+        fun_fact = pick_random_funfact()
+    place_name, forecast_summary, stock_summaries = get_morning_content()
+    stock_summaries = " ".join(stock_summaries)
+    stock_summaries_str = f"Then report on their stock movements, which are: {stock_summaries}" if stock_summaries != "" else ""
+
+    today = datetime.now().strftime("%B %d, %Y")
+    name = personality['name']
+    voice_id = personality['voice_id']
+    base_prompt = personality['prompt']
+
+    prompt = f"Your name is {name}. {base_prompt} Today's forecast for {place_name} is {forecast_summary}. Today's date is {today}. First give the weather report for today. {stock_summaries_str} Finally throw in this fun fact: \"{fun_fact}\". Keep it under 200 words." if forecast_summary != None else \
+        f"Your name is {name}. {base_prompt} Unfortunately you were unable to determine today's forecast before getting on. Create an excuse as to why you are unprepared. {stock_summaries_str} Finally, make sure to throw in this fun fact: \"{fun_fact}\". Keep it under 200 words."
+
+    print(f"Generating morning announcement with personality: {name}", flush=True)
+    return ask_gemini(prompt), voice_id
+
+def get_pooled_announcement(personality=None, fun_fact=None):
+    """
+    Generates a morning announcement that doesn't depend on the day it's played, to be kept in the announcement pool.
+    The weather is kept generic, and there are no stock movements since those would be stale by the time it's played.
+    """
+    if personality is None:
+        personality = pick_random_personality()
+    if fun_fact is None:
+        fun_fact = pick_random_funfact()
+
+    name = personality['name']
+    voice_id = personality['voice_id']
+    base_prompt = personality['prompt']
+
+    prompt = f"Your name is {name}. {base_prompt} This segment will be played on a future morning, so don't mention a date, specific temperatures or conditions. First give a general good morning and tell them to check the weather before heading out. Finally throw in this fun fact: \"{fun_fact}\". Keep it under 150 words."
+
+    print(f"Generating pooled announcement with personality: {name}", flush=True)
+    return ask_gemini(prompt, retries=0), voice_id
+
+def refill_announcement_pool():
+    """
+    Renders announcements into the announcement pool until it is full, or renders one to replace the oldest if it's
+    time to roll a new one in. Stops early if Gemini or ElevenLabs fails.
+    """
+    while pool_needs_refill():
+        announcement, voice_id = get_pooled_announcement()
+        if not announcement:
+            return
+        rendering_file = os.path.join(POOL_DIR, "rendering.mp3")
+        if not tts(voice_id=voice_id, text=announcement, output_filename=rendering_file):
+            return
+        add_to_pool(rendering_file)
+
+def run_announcement_pool_worker(is_idle=None):
+    """
+    Keeps the announcement pool topped up, only rendering during the daytime hours in POOL_REFILL_HOURS
+    and while is_idle() (if given) returns True, so the network is never being used for it at alarm time.
+    """
+    while True:
+        if datetime.now().hour in POOL_REFILL_HOURS and (is_idle is None or is_idle()):
+            try:
+                refill_announcement_pool()
+            except Exception as e:
+                print(f"Failed to refill announcement pool: {e}", flush=True)
+        time.sleep(POOL_CHECK_INTERVAL)
 
 def generate_morning_announcement(output_file):
     """
     Main function to generate and save the morning announcement.
+    If it can't be generated live, a pre-rendered announcement from the announcement pool is used instead.
     """
-    # You can change the location here
-    announcement, voice_id = get_morning_announcement()
-    if announcement:
-        return tts(voice_id=voice_id, text=announcement, output_filename=output_file)
+    personality = pick_random_personality()
+    fun_fact = pick_random_funfact()
+    announcement, voice_id = get_morning_announcement(personality, fun_fact)
+    # render to a separate file so output_file never exists half-written
+    rendering_file = f"{os.path.splitext(output_file)[0]}.rendering.mp3"
+    if announcement and tts(voice_id=voice_id, text=announcement, output_filename=rendering_file):
+        os.replace(rendering_file, output_file)
+        return True
+    if os.path.exists(output_file) or take_from_pool(output_file):
+        return True
+    if announcement is None:
+        # the pool is empty, so fall back to reading the bare fun fact
+        return tts(voice_id=voice_id, text=fun_fact, output_filename=output_file)
+    return False
 
 if __name__ == "__main__":
     generate_morning_announcement("morning_announcement.mp3")
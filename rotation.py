@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+
+class ShuffleBag:
+    """
+    Hands out the indexes 0..size-1 in a random order, never repeating one until every
+    index in the pool has been used, then reshuffles.
+
+    Instead of remembering every item that has been used, only a random seed and a cursor are
+    persisted. The seed keys a small Feistel network that maps the cursor to its place in the
+    shuffle, so each pick is O(1) no matter how big the pool is.
+    The pool size is fixed when a shuffle starts, so items appended to the pool mid-shuffle
+    don't change upcoming picks; they join in on the next shuffle.
+    """
+    ROUNDS = 4
+
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.state = self._load()
+        self.lock = threading.Lock() # picks can come from the announcement pool worker and the alarm at the same time
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return None
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            # state files from before the shuffle was seeded can't be continued
+            return state if "seed" in state else None
+        except (OSError, ValueError):
+            print(f"Could not read rotation state '{self.state_file}', starting a new shuffle.", flush=True)
+            return None
+
+    def _save(self):
+        temp_file = self.state_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp_file, self.state_file)
+
+    def _round(self, seed, round_number, value):
+        digest = hashlib.blake2b(f"{seed}:{round_number}:{value}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def _permute(self, index, size, seed):
+        """Maps index to its place in the shuffle of 0..size-1 keyed by seed."""
+        # the Feistel network shuffles the smallest even number of bits that covers the pool, so it can
+        # land outside the pool; "cycle walking" re-applies it until it lands inside, which keeps it a permutation
+        half_bits = max(((size - 1).bit_length() + 1) // 2, 1)
+        mask = (1 << half_bits) - 1
+        while True:
+            left, right = index >> half_bits, index & mask
+            for round_number in range(self.ROUNDS):
+                left, right = right, left ^ (self._round(seed, round_number, right) & mask)
+            index = (left << half_bits) | right
+            if index < size:
+                return index
+
+    def _new_shuffle(self, size, last):
+        seed = random.getrandbits(64)
+        while size > 1 and self._permute(0, size, seed) == last:
+            # don't repeat the last pick of the previous shuffle
+            seed = random.getrandbits(64)
+        return {"size": size, "seed": seed, "cursor": 0, "last": last}
+
+    def pick(self, size):
+        """Returns the next index in 0..size-1 and persists the new cursor."""
+        if size <= 0:
+            raise ValueError("Cannot pick from an empty pool.")
+        with self.lock:
+            return self._pick(size)
+
+    def _pick(self, size):
+        state = self.state
+        if state is None or state["cursor"] >= state["size"] or state["size"] > size:
+            # start a new shuffle if the last one is used up, or if items were removed from the pool
+            self.state = state = self._new_shuffle(size, state["last"] if state is not None else None)
+        index = self._permute(state["cursor"], state["size"], state["seed"])
+        state["cursor"] += 1
+        state["last"] = index
+        self._save()
+        return index
+
+class LineIndex:
+    """
+    Byte offsets of the non-blank lines in a text file, kept in a sidecar file so a single line
+    can be read by its number without reading the whole file. Lines appended to the text file
+    are indexed incrementally; if the text file was rewritten, the index is rebuilt.
+    - Index file layout: number of bytes of the text file that have been indexed, followed by
+      the offset of each non-blank line, all as little-endian unsigned 64-bit ints.
+    """
+    ENTRY = struct.Struct("<Q")
+
+    def __init__(self, text_file, index_file):
+        self.text_file = text_file
+        self.index_file = index_file
+        # refreshes rewrite the index file, so two zones picking at once must not interleave. Reentrant so a caller
+        # can hold it across refresh(), picking and line()
+        self.lock = threading.RLock()
+
+    def _indexed_bytes(self):
+        if not os.path.exists(self.index_file):
+            return None
+        with open(self.index_file, 'rb') as f:
+            header = f.read(self.ENTRY.size)
+        return self.ENTRY.unpack(header)[0] if len(header) == self.ENTRY.size else None
+
+    def refresh(self, rebuild=False):
+        """Indexes any lines added to the text file since the last refresh and returns the number of lines."""
+        with self.lock:
+            return self._refresh(rebuild)
+
+    def _refresh(self, rebuild):
+        text_size = os.path.getsize(self.text_file)
+        indexed = None if rebuild else self._indexed_bytes()
+        if indexed is None or indexed > text_size:
+            with open(self.index_file, 'wb') as f:
+                f.write(self.ENTRY.pack(0))
+            indexed = 0
+        if 0 < indexed < text_size and len(self) > 0:
+            with open(self.text_file, 'rb') as src:
+                src.seek(indexed - 1)
+                partial_line = src.read(1) != b"\n"
+            if partial_line:
+                # the last line had no newline when it was indexed and may have been appended to, so index it again
+                with open(self.index_file, 'r+b') as index:
+                    index.seek(-self.ENTRY.size, os.SEEK_END)
+                    indexed = self.ENTRY.unpack(index.read(self.ENTRY.size))[0]
+                    index.truncate(os.path.getsize(self.index_file) - self.ENTRY.size)
+        if indexed < text_size:
+            with open(self.text_file, 'rb') as src, open(self.index_file, 'r+b') as index:
+                src.seek(indexed)
+                index.seek(0, os.SEEK_END)
+                offset = indexed
+                for line in src:
+                    if line.strip():
+                        index.write(self.ENTRY.pack(offset))
+                    offset += len(line)
+                index.seek(0)
+                index.write(self.ENTRY.pack(offset))
+        return len(self)
+
+    def __len__(self):
+        if not os.path.exists(self.index_file):
+            return 0
+        return max(os.path.getsize(self.index_file) // self.ENTRY.size - 1, 0)
+
+    def _read_line(self, number):
+        if number >= len(self):
+            return None
+        with open(self.index_file, 'rb') as index:
+            index.seek((number + 1) * self.ENTRY.size)
+            offset = self.ENTRY.unpack(index.read(self.ENTRY.size))[0]
+        with open(self.text_file, 'rb') as src:
+            if offset > 0:
+                src.seek(offset - 1)
+                if src.read(1) != b"\n":
+                    # the text file was edited in place, so the offset no longer starts a line
+                    return None
+            else:
+                src.seek(0)
+            return src.readline().decode('utf-8').strip()
+
+    def line(self, number):
+        """Returns the line with the given number (counting only non-blank lines), or None if there is no such line."""
+        with self.lock:
+            line = self._read_line(number)
+            if not line:
+                self._refresh(rebuild=True)
+                line = self._read_line(number)
+            return line
@@ -0,0 +1,150 @@
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from whitenoise import PCM_PLAYER
+
+# --- Configuration ---
+CHECK_INTERVAL = 30 # seconds between connection checks
+RECONNECT_MIN_BACKOFF = 5 # seconds
+RECONNECT_MAX_BACKOFF = 300 # seconds
+SETTLE_SECONDS = 2 # bluetooth is glitchy for the first few secs after connecting, so audio isn't started until it settles
+WARM_UP_MAX_SECONDS = 1800 # stop streaming silence if nothing stops the warm up by then
+
+class Speaker:
+    """
+    Keeps a bluetooth speaker connected, reconnecting with exponential backoff if it drops.
+    Before the alarm, silence is streamed to the speaker so it is awake (and past its glitchy first
+    seconds) by the time the alarm starts playing.
+    """
+    def __init__(self, mac, warm_up_seconds=60, env=None):
+        """
+        Args:
+            mac (str): The speaker's bluetooth MAC address.
+            warm_up_seconds (int): How long before the alarm to start streaming silence.
+            env (dict): Environment for the silence player process, e.g. to choose the audio output.
+        """
+        self.mac = mac
+        self.warm_up_seconds = warm_up_seconds
+        self.env = env
+        self.connected_since = None
+        self.warm_up_at = None
+        self.silence_process = None
+        self.urgent = False # skip the backoff, someone is waiting for the speaker
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Starts monitoring the connection in the background."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._monitor, daemon=True)
+            self.thread.start()
+
+    def is_connected(self):
+        try:
+            output = subprocess.run(["bluetoothctl", "info", self.mac], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Could not check speaker connection: {e}", flush=True)
+            return False
+        return "Connected: yes" in output
+
+    def connect(self):
+        print(f"Connecting to speaker {self.mac}...", flush=True)
+        try:
+            subprocess.run(["bluetoothctl", "connect", self.mac], capture_output=True, timeout=20)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Failed to connect to speaker: {e}", flush=True)
+            return False
+        return self.is_connected()
+
+    def wait_until_ready(self, timeout):
+        """
+        Blocks until the speaker is connected and has settled, or until timeout seconds have passed.
+        Returns whether the speaker is ready.
+        """
+        deadline = time.monotonic() + timeout
+        if not self.is_connected():
+            self.connected_since = None
+            self.urgent = True
+            self.wake.set()
+        elif self.connected_since is None:
+            # it reconnected by itself while the monitor was asleep, so only wait for it to settle
+            self.connected_since = time.monotonic()
+            self.wake.set()
+        while time.monotonic() < deadline:
+            connected_since = self.connected_since
+            if connected_since is not None and time.monotonic() - connected_since >= SETTLE_SECONDS:
+                return True
+            time.sleep(0.1)
+        print(f"Speaker wasn't ready after {timeout} seconds", flush=True)
+        return False
+
+    def schedule_warm_up(self, alarm_time):
+        """Starts streaming silence to the speaker warm_up_seconds before alarm_time."""
+        self.warm_up_at = alarm_time - timedelta(seconds=self.warm_up_seconds)
+        print(f"Speaker warm up scheduled for {self.warm_up_at}", flush=True)
+        self.wake.set()
+
+    def stop_warm_up(self):
+        self.warm_up_at = None
+        self.wake.set()
+        self._stop_silence()
+
+    def _start_silence(self):
+        with self.lock:
+            if self.silence_process is not None and self.silence_process.poll() is None:
+                return
+            print("Streaming silence to wake up the speaker", flush=True)
+            with open("/dev/zero", 'rb') as zeros:
+                self.silence_process = subprocess.Popen(PCM_PLAYER, stdin=zeros, env=self.env)
+
+    def _stop_silence(self):
+        with self.lock:
+            if self.silence_process is not None:
+                self.silence_process.kill()
+                self.silence_process.wait()
+                self.silence_process = None
+
+    def _update_warm_up(self):
+        warm_up_at = self.warm_up_at
+        now = datetime.now()
+        if warm_up_at is None or now < warm_up_at:
+            return
+        if now >= warm_up_at + timedelta(seconds=WARM_UP_MAX_SECONDS):
+            self.stop_warm_up()
+        elif self.connected_since is not None:
+            self._start_silence()
+        else:
+            self.urgent = True
+
+    def _monitor(self):
+        backoff = RECONNECT_MIN_BACKOFF
+        next_attempt = 0
+        while True:
+            self.wake.clear()
+            connected = self.is_connected()
+            if connected:
+                if self.connected_since is None:
+                    print(f"Speaker {self.mac} is connected", flush=True)
+                    self.connected_since = time.monotonic()
+                backoff = RECONNECT_MIN_BACKOFF
+            else:
+                if self.connected_since is not None:
+                    print(f"Speaker {self.mac} disconnected", flush=True)
+                    self.connected_since = None
+                self._update_warm_up() # sets urgent if the warm up is due
+                if self.urgent or time.monotonic() >= next_attempt:
+                    self.urgent = False
+                    if self.connect():
+                        continue
+                    print(f"Failed to connect to speaker, trying again in {backoff} seconds", flush=True)
+                    next_attempt = time.monotonic() + backoff
+                    backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+            self._update_warm_up()
+            wait = CHECK_INTERVAL if connected else min(CHECK_INTERVAL, max(next_attempt - time.monotonic(), 0))
+            warm_up_at = self.warm_up_at
+            if warm_up_at is not None and warm_up_at > datetime.now():
+                # make sure the warm up isn't started late
+                wait = min(wait, (warm_up_at - datetime.now()).total_seconds())
+            self.wake.wait(wait)
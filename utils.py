@@ -1,5 +1,9 @@
 import csv
 import subprocess
+import requests
+
+# Shared by every module (and every zone), so HTTP connections are pooled and reused instead of reconnecting for every request.
+http = requests.Session()
 
 def get_wifi_ssid():
     """Gets the SSID of the currently connected Wi-Fi network (Linux/Debian)."""
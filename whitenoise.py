@@ -0,0 +1,183 @@
+import array
+import hashlib
+import mmap
+import os
+import subprocess
+import sys
+import threading
+
+# --- Configuration ---
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2 # bytes, signed 16-bit
+LOOP_SECONDS = 300 # only the first few minutes of the source are used, white noise doesn't need more to sound continuous
+CROSSFADE_SECONDS = 5 # the end of the loop is crossfaded into the start so there is no gap or click at the loop point
+CHUNK_SECONDS = 0.5
+CACHE_DIR = ".cache"
+# Raw PCM is piped to aplay, which blocks on a full buffer, so streaming costs almost no CPU compared to decoding MP3 all night.
+PCM_PLAYER = ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-c", str(CHANNELS), "-r", str(SAMPLE_RATE)]
+
+FRAME_SIZE = SAMPLE_WIDTH * CHANNELS
+CHUNK_SIZE = int(SAMPLE_RATE * CHUNK_SECONDS) * FRAME_SIZE
+
+prepare_lock = threading.Lock() # shared by every WhiteNoise, so zones looping the same file only transcode it once
+
+class WhiteNoise:
+    """
+    Plays a sound file on a gapless loop. The file is transcoded once into a cached, crossfaded PCM
+    file, which is memory-mapped and streamed straight to the audio output.
+    """
+    def __init__(self, source_file, env=None):
+        """
+        Args:
+            source_file (str): The sound file to loop.
+            env (dict): Environment for the player process, e.g. to choose the audio output.
+        """
+        self.source_file = source_file
+        self.env = env
+        self.thread = None
+        self.stream = None
+
+    def _cache_file(self):
+        # the cache is keyed on the source file and the loop settings, so it's re-made if any of them change
+        stat = os.stat(self.source_file)
+        key = f"{os.path.abspath(self.source_file)}|{stat.st_size}|{stat.st_mtime}|{LOOP_SECONDS}|{CROSSFADE_SECONDS}|{SAMPLE_RATE}|{CHANNELS}"
+        return os.path.join(CACHE_DIR, f"whitenoise-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}.pcm")
+
+    def prepare(self):
+        """Transcodes the source file into the loop cache if it isn't cached yet. Returns the cache file, or None if it failed."""
+        try:
+            return self._prepare()
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Failed to prepare white noise loop: {e}", flush=True)
+            return None
+
+    def _prepare(self):
+        with prepare_lock:
+            cache_file = self._cache_file()
+            if os.path.exists(cache_file):
+                return cache_file
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            print(f"Transcoding '{self.source_file}' into a seamless loop...", flush=True)
+            # play from CROSSFADE_SECONDS to the end, crossfading the end into the first CROSSFADE_SECONDS,
+            # so the end of the loop blends into where the next pass starts
+            filter_graph = (
+                f"[0:a]asplit[a][b];"
+                f"[a]atrim=start={CROSSFADE_SECONDS},asetpts=PTS-STARTPTS[body];"
+                f"[b]atrim=end={CROSSFADE_SECONDS},asetpts=PTS-STARTPTS[head];"
+                f"[body][head]acrossfade=d={CROSSFADE_SECONDS}:c1=tri:c2=tri[out]"
+            )
+            transcoding_file = cache_file + ".part"
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-y", "-t", str(LOOP_SECONDS + CROSSFADE_SECONDS), "-i", self.source_file,
+                 "-filter_complex", filter_graph, "-map", "[out]",
+                 "-f", "s16le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), transcoding_file])
+            if result.returncode != 0 or os.path.getsize(transcoding_file) < FRAME_SIZE:
+                print(f"Failed to transcode '{self.source_file}'", flush=True)
+                if os.path.exists(transcoding_file):
+                    os.remove(transcoding_file)
+                return None
+            os.replace(transcoding_file, cache_file)
+            print(f"Loop cached to '{cache_file}'", flush=True)
+            return cache_file
+
+    @property
+    def is_playing(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, fade_in_seconds=0):
+        """
+        Starts looping the white noise, fading in over fade_in_seconds.
+        Returns False if the loop isn't cached yet, so the caller can fall back to another player
+        instead of waiting for the transcode. The loop is then prepared in the background for next time.
+        """
+        try:
+            cache_file = self._cache_file()
+        except OSError as e:
+            print(f"Failed to prepare white noise loop: {e}", flush=True)
+            return False
+        if not os.path.exists(cache_file):
+            print("White noise loop isn't cached yet", flush=True)
+            if not prepare_lock.locked():
+                threading.Thread(target=self.prepare, daemon=True).start()
+            return False
+        self.stop()
+        if self.thread is not None:
+            self.thread.join() # never let two streams play at once
+        try:
+            player = subprocess.Popen(PCM_PLAYER, stdin=subprocess.PIPE, env=self.env)
+        except OSError as e:
+            print(f"Failed to start white noise player: {e}", flush=True)
+            return False
+        # each stream gets its own stop request, so stopping one can't change the fade of another
+        self.stream = {"player": player, "stopping": threading.Event(), "fade_out_seconds": 0}
+        self.thread = threading.Thread(target=self._stream, args=(self.stream, cache_file, fade_in_seconds), daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, fade_out_seconds=0):
+        """
+        Stops the white noise, fading out over fade_out_seconds. Doesn't wait for the fade to finish.
+        Stopping with no fade while a fade is running cuts it short.
+        """
+        stream = self.stream
+        if stream is None or not self.is_playing:
+            return
+        if fade_out_seconds <= 0:
+            stream["fade_out_seconds"] = 0
+            stream["stopping"].set()
+            stream["player"].kill() # stops the sound right away, even if the stream is blocked writing to the player
+        elif not stream["stopping"].is_set():
+            stream["fade_out_seconds"] = fade_out_seconds
+            stream["stopping"].set()
+
+    def _stream(self, stream, cache_file, fade_in_seconds):
+        print(f"Streaming white noise loop '{cache_file}'", flush=True)
+        player = stream["player"]
+        stopping = stream["stopping"]
+        try:
+            with open(cache_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as loop:
+                loop_size = len(loop) - len(loop) % FRAME_SIZE
+                position = 0
+                played = 0.0
+                fade_out_start = None
+                fade_out_seconds = 0
+
+                def gain_at(seconds):
+                    gain = min(seconds / fade_in_seconds, 1.0) if fade_in_seconds > 0 else 1.0
+                    if fade_out_start is not None:
+                        gain = min(gain, 1.0 - (seconds - fade_out_start) / fade_out_seconds)
+                    return max(gain, 0.0)
+
+                while True:
+                    if stopping.is_set():
+                        if stream["fade_out_seconds"] <= 0:
+                            break
+                        if fade_out_start is None:
+                            fade_out_start = played
+                            fade_out_seconds = stream["fade_out_seconds"]
+                    chunk = loop[position:min(position + CHUNK_SIZE, loop_size)]
+                    position = (position + len(chunk)) % loop_size
+                    duration = len(chunk) / (FRAME_SIZE * SAMPLE_RATE)
+                    start_gain, end_gain = gain_at(played), gain_at(played + duration)
+                    if start_gain <= 0 and fade_out_start is not None:
+                        break
+                    player.stdin.write(chunk if start_gain >= 1.0 and end_gain >= 1.0 else _fade(chunk, start_gain, end_gain))
+                    played += duration
+        except (BrokenPipeError, ValueError) as e:
+            if not stopping.is_set():
+                print(f"White noise player stopped unexpectedly: {e}", flush=True)
+        finally:
+            player.kill()
+            player.wait()
+
+def _fade(chunk, start_gain, end_gain):
+    """Ramps the volume of a chunk of PCM samples from start_gain to end_gain, only used while fading."""
+    samples = array.array('h', chunk)
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    step = (end_gain - start_gain) / (len(samples) // CHANNELS)
+    samples = array.array('h', [int(sample * (start_gain + step * (i // CHANNELS))) for i, sample in enumerate(samples)])
+    if sys.byteorder != 'little':
+        samples.byteswap()
+    return samples.tobytes()